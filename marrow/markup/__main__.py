@@ -0,0 +1,222 @@
+# encoding: utf-8
+
+"""Batch conversion of a directory tree of Textile markup to HTML.
+
+Run as `python -m marrow.markup source [destination]`.  Files are converted in parallel across a process pool; a
+manifest of content hashes kept in the destination allows unchanged files to be skipped on subsequent runs, and every
+output is written to a temporary file then renamed into place so readers never observe a partial document.  The
+manifest also records the package version and conversion options; should either change, every file is converted.
+"""
+
+# ## Imports
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+
+from argparse import ArgumentParser
+from multiprocessing import Pool, cpu_count
+
+from marrow.markup.release import version
+
+
+# ## Module Exports
+
+__all__ = ['main']
+
+
+# ## Helpers
+
+def _replace(source, target):
+	"""Atomically move a file into place, replacing any existing file."""
+	try:
+		os.replace(source, target)
+	except AttributeError:  # Python 2; rename is atomic on POSIX but refuses to overwrite on Windows.
+		if os.name == 'nt' and os.path.exists(target):
+			os.remove(target)
+		
+		os.rename(source, target)
+
+
+def _mode(path):
+	"""Return the permissions for a file written to path: those of the file replaced, or the default for new files.
+	
+	Temporary files are created readable only by their owner, so without this every output would be left private.
+	"""
+	try:
+		return os.stat(path).st_mode & 0o7777
+	except OSError:
+		pass
+	
+	umask = os.umask(0)
+	os.umask(umask)
+	
+	return 0o666 & ~umask
+
+
+def _write(path, data):
+	"""Write the given bytes to a path via a temporary file in the same directory."""
+	directory = os.path.dirname(path)
+	
+	if not os.path.isdir(directory):
+		try:
+			os.makedirs(directory)
+		except OSError:  # Created concurrently by another worker.
+			if not os.path.isdir(directory):
+				raise
+	
+	fd, temporary = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=directory)
+	
+	try:
+		with os.fdopen(fd, 'wb') as fh:
+			fh.write(data)
+		
+		os.chmod(temporary, _mode(path))
+		_replace(temporary, path)
+	
+	except:
+		os.remove(temporary)
+		raise
+
+
+def _convert(job):
+	"""Convert a single file, unless its content hash matches the previous run.
+	
+	Executed within the worker processes; returns a (name, digest, size, duration, converted, error) tuple.
+	"""
+	name, source, target, previous, encoding = job
+	start = time.time()
+	
+	try:
+		with open(source, 'rb') as fh:
+			data = fh.read()
+		
+		digest = hashlib.sha1(data).hexdigest()
+		
+		if digest == previous and os.path.exists(target):
+			return name, digest, len(data), time.time() - start, False, None
+		
+		from marrow.markup.textile import Parser
+		
+		_write(target, Parser(data, encoding).render().encode('utf-8'))
+	
+	except Exception as e:
+		return name, None, 0, time.time() - start, False, "{0}: {1}".format(e.__class__.__name__, e)
+	
+	return name, digest, len(data), time.time() - start, True, None
+
+
+def _load(path, options):
+	"""Return the digests recorded by a previous run, provided it used the same version and options."""
+	try:
+		with open(path) as fh:
+			manifest = json.load(fh)
+	
+	except (IOError, OSError, ValueError):
+		return {}
+	
+	if not isinstance(manifest, dict) or manifest.get('version') != version or manifest.get('options') != options:
+		return {}
+	
+	return manifest.get('files') or {}
+
+
+def _discover(source, destination, extensions):
+	"""Generate (name, source path, target path) for each markup file beneath the source directory."""
+	for root, directories, files in os.walk(source):
+		directories[:] = sorted(i for i in directories if not i.startswith('.'))
+		
+		for filename in sorted(files):
+			base, extension = os.path.splitext(filename)
+			if extension not in extensions:
+				continue
+			
+			path = os.path.join(root, filename)
+			name = os.path.relpath(path, source)
+			
+			yield name, path, os.path.join(destination, os.path.dirname(name), base + '.html')
+
+
+# ## Command-Line Interface
+
+def main(argv=None):
+	parser = ArgumentParser(prog='python -m marrow.markup', description="Convert a tree of Textile markup to HTML.")
+	parser.add_argument('source', help="directory to search for markup files")
+	parser.add_argument('destination', nargs='?', help="directory to write HTML to; defaults to the source directory")
+	parser.add_argument('-e', '--extension', action='append', dest='extensions', metavar='EXT',
+			help="extension of files to convert; may be repeated (default: .textile)")
+	parser.add_argument('-j', '--jobs', type=int, default=cpu_count(), help="number of worker processes")
+	parser.add_argument('-f', '--force', action='store_true', help="convert every file, ignoring the manifest")
+	parser.add_argument('--encoding', default='utf-8', help="encoding of the source files (default: utf-8)")
+	parser.add_argument('--manifest', help="content hash manifest path (default: DESTINATION/.markup.json)")
+	parser.add_argument('--slowest', type=int, default=5, metavar='N', help="number of slowest files to report")
+	
+	options = parser.parse_args(argv)
+	
+	source = os.path.abspath(options.source)
+	destination = os.path.abspath(options.destination or options.source)
+	extensions = set(i if i.startswith('.') else '.' + i for i in (options.extensions or ['.textile']))
+	manifest = options.manifest or os.path.join(destination, '.markup.json')
+	
+	if not os.path.isdir(source):
+		parser.error("source directory not found: " + options.source)
+	
+	settings = dict(encoding=options.encoding)  # Conversion options which affect the output.
+	previous = {} if options.force else _load(manifest, settings)
+	
+	jobs = [(name, path, target, previous.get(name), options.encoding)
+			for name, path, target in _discover(source, destination, extensions)]
+	
+	digests = {}
+	converted = []
+	failed = []
+	skipped = 0
+	size = 0
+	start = time.time()
+	
+	pool = Pool(max(1, options.jobs))
+	
+	try:
+		for name, digest, length, duration, changed, error in pool.imap_unordered(_convert, jobs, chunksize=8):
+			if error:
+				failed.append((name, error))
+				print("error: {0}: {1}".format(name, error), file=sys.stderr)
+				continue
+			
+			digests[name] = digest
+			
+			if not changed:
+				skipped += 1
+				continue
+			
+			converted.append((duration, name))
+			size += length
+	
+	finally:
+		pool.close()
+		pool.join()
+		
+		_write(manifest, json.dumps(dict(version=version, options=settings, files=digests),
+				indent=1, sort_keys=True).encode('utf-8'))
+	
+	elapsed = max(time.time() - start, 1e-6)
+	
+	print("{0} converted, {1} unchanged, {2} failed in {3:.2f}s".format(len(converted), skipped, len(failed), elapsed))
+	print("{0:.1f} files/s, {1:.2f} MB/s".format(len(converted) / elapsed, size / elapsed / 1048576))
+	
+	if converted and options.slowest:
+		print("slowest:")
+		
+		for duration, name in sorted(converted, reverse=True)[:options.slowest]:
+			print("  {0:8.3f}s  {1}".format(duration, name))
+	
+	return 1 if failed else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
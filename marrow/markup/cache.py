@@ -0,0 +1,44 @@
+# encoding: utf-8
+
+"""A bounded cache of rendered fragments, shareable between parsers."""
+
+from collections import OrderedDict
+
+
+class FragmentCache(object):
+	"""A mapping of keys to rendered fragments which discards the least recently used beyond a fixed size."""
+	
+	__slots__ = ('size', '_fragments')
+	
+	def __init__(self, size=4096):
+		self.size = size
+		self._fragments = OrderedDict()
+	
+	def __len__(self):
+		return len(self._fragments)
+	
+	def __contains__(self, key):
+		return key in self._fragments
+	
+	def get(self, key, default=None):
+		"""Retrieve a fragment, marking it as the most recently used."""
+		fragments = self._fragments
+		
+		try:
+			fragment = fragments.pop(key)
+		except KeyError:
+			return default
+		
+		fragments[key] = fragment
+		return fragment
+	
+	def __setitem__(self, key, fragment):
+		fragments = self._fragments
+		fragments.pop(key, None)
+		fragments[key] = fragment
+		
+		if len(fragments) > self.size:
+			fragments.popitem(last=False)
+	
+	def clear(self):
+		self._fragments.clear()
@@ -4,10 +4,88 @@
 
 from bisect import bisect
 
+from marrow.markup.cache import FragmentCache
+from marrow.markup.token import Token
+
+
+_scanners = FragmentCache(64)  # The most recently used compiled scanners, keyed by the delimiters they recognize.
+
+
+def _specialize(delimiters):
+	"""Generate and compile a scanning function recognizing exactly the given delimiters.
+	
+	The result is equivalent to `Parser._search` but written out for one delimiter set: the next occurrence of each
+	initial character is tracked using `str.find`, so runs of plain text are skipped without visiting each character,
+	and every comparison is against a literal.  Functions are cached by delimiter set and shared between parsers; the
+	delimiters must be in canonical order, longest first then lexically, as maintained by `Parser.add`.
+	"""
+	scanner = _scanners.get(delimiters)
+	if scanner:
+		return scanner
+	
+	groups = {}
+	for delimiter in delimiters:  # Longest first, which each group preserves.
+		groups.setdefault(delimiter[0], []).append(delimiter)
+	
+	groups = sorted(groups.items())
+	names = ["n{0}".format(n) for n in range(len(groups))]  # The next offset of each initial character.
+	
+	source = ["def scan(text):", "\tfind = text.find", "\tlength = len(text)"]
+	
+	for name, (initial, group) in zip(names, groups):
+		source.extend((
+				"\t{0} = find({1!r})".format(name, initial),
+				"\tif {0} < 0: {0} = length".format(name),
+			))
+	
+	source.extend(("\twhile True:", "\t\ti = " + names[0]))
+	source.extend("\t\tif {0} < i: i = {0}".format(name) for name in names[1:])
+	source.append("\t\tif i >= length: return")
+	
+	for n, (name, (initial, group)) in enumerate(zip(names, groups)):
+		source.append("\t\t{0} i == {1}:".format('elif' if n else 'if', name))
+		
+		longer = [delimiter for delimiter in group if len(delimiter) > 1]
+		for m, delimiter in enumerate(longer):
+			source.extend((
+					"\t\t\t{0} text.startswith({1!r}, i):".format('elif' if m else 'if', delimiter),
+					"\t\t\t\tyield i, {0!r}".format(delimiter),
+					"\t\t\t\ti += {0}".format(len(delimiter)),
+				))
+		
+		indent = "\t\t\t"
+		if longer:
+			source.append("\t\t\telse:")
+			indent += "\t"
+		
+		if initial in group:
+			source.append(indent + "yield i, {0!r}".format(initial))
+		
+		source.append(indent + "i += 1")
+	
+	for name, (initial, group) in zip(names, groups):
+		source.extend((
+				"\t\tif {0} < i:".format(name),
+				"\t\t\t{0} = find({1!r}, i)".format(name, initial),
+				"\t\t\tif {0} < 0: {0} = length".format(name),
+			))
+	
+	namespace = {}
+	exec(compile("\n".join(source), "<scanner {0!r}>".format(delimiters), 'exec'), namespace)
+	
+	scanner = _scanners[delimiters] = namespace['scan']
+	return scanner
+
 
 class Parser(object):
-	def __init__(self):
+	def __init__(self, specialize=False):
 		self.tokens = []
+		self.specialize = specialize  # Compile a dedicated scanner for the registered tokens.
+		self._scanner = None
+		self._openers = {}  # Delimiter to the tokens it may open.
+		self._closers = {}  # Delimiter to the tokens it may close.
+		self._marks = {}  # Delimiter to the standalone token it represents.
+		self._delimiters = ()  # All known delimiters, longest first then lexically.
 	
 	def add(self, token):
 		"""Register a token with the parser.
@@ -15,22 +93,200 @@ class Parser(object):
 		This maintains the ordered nature of the token list by token length.
 		"""
 		self.tokens.insert(bisect(self.tokens, token), token)
+		
+		if token.suffix is None:
+			self._marks[token.prefix] = token
+		else:
+			self._openers.setdefault(token.prefix, []).append(token)
+			self._closers.setdefault(token.suffix, []).append(token)
+		
+		delimiters = set(self._openers) | set(self._closers) | set(self._marks)
+		self._delimiters = tuple(sorted(delimiters, key=lambda d: (-len(d), d)))
+		self._scanner = None
 	
 	def __call__(self, text):
-		"""Generate a series of annotations for the given input text."""
+		"""Generate a series of annotations for the given input text.
+		
+		Enclosing tokens are paired in a single left-to-right pass over the delimiters found in the text, in the manner
+		of the CommonMark delimiter run algorithm.  A delimiter able to close an opener already on the stack does so,
+		discarding any unmatched openers above it; otherwise it is pushed as a potential opener.  Annotations are emitted
+		properly nested, ordered by offset, each time the outermost enclosure closes.
+		"""
+		openers = self._openers
+		closers = self._closers
+		marks = self._marks
+		
+		stack = []  # Potential openers as (offset, end of prefix, token) tuples.
+		counts = {}  # The number of potential openers on the stack for each token.
+		matched = []  # Enclosures waiting to be emitted as (offset, end of prefix, suffix offset, end, token) tuples.
+		resume = 0  # Delimiters before this offset have been consumed by verbatim or trailing text.
+		
+		for offset, delimiter in self._scan(text):
+			if offset < resume:
+				continue
+			
+			end = offset + len(delimiter)
+			
+			if delimiter in marks:
+				matched.append((offset, end, end, end, marks[delimiter]))
+			
+			for token in closers.get(delimiter, ()):
+				if not counts.get(token) or not token.closes(text, offset):
+					continue
+				
+				index = len(stack) - 1
+				while stack[index][2] is not token:
+					index -= 1
+				
+				start, inner, _ = stack[index]
+				if inner == offset:
+					continue  # Enclosures may not be empty.
+				
+				for opener in stack[index:]:
+					counts[opener[2]] -= 1
+				
+				del stack[index:]
+				resume = token.extent(text, end)
+				matched.append((start, inner, offset, resume, token))
+				break
+			
+			else:
+				for token in openers.get(delimiter, ()):
+					if not token.opens(text, offset):
+						continue
+					
+					if not token.verbatim:
+						stack.append((offset, end, token))
+						counts[token] = counts.get(token, 0) + 1
+						continue
+					
+					# Verbatim enclosures are matched immediately against the next acceptable suffix.
+					suffix = token.suffix
+					close = text.find(suffix, end + 1)
+					while close > 0 and not token.closes(text, close):
+						close = text.find(suffix, close + 1)
+					
+					if close > 0:
+						resume = token.extent(text, close + len(suffix))
+						matched.append((offset, end, close, resume, token))
+						break
+			
+			if matched and not stack:
+				for annotation in self._annotate(matched):
+					yield annotation
+				
+				matched = []
+		
+		for annotation in self._annotate(matched):
+			yield annotation
+	
+	def split(self, text):
+		"""Split text into alternating plain and annotated segments.
+		
+		Generates (tokens, text) pairs in order, tokens being a tuple of the tokens enclosing that text, outermost first,
+		and empty for plain text.  Delimiters are omitted.  Standalone (mark) tokens are given a segment of their own,
+		their text being the matched mark, with the mark last in the tuple of tokens.  The text is parsed lazily, in a
+		single pass.
+		"""
+		tokens = ()
+		segment = []
+		
+		for enclosing, part in self._segments(text):
+			if segment and (enclosing != tokens or enclosing[-1].suffix is None):
+				yield tokens, text[:0].join(segment)
+				segment = []
+			
+			tokens = enclosing
+			segment.append(part)
+		
+		if segment:
+			yield tokens, text[:0].join(segment)
+	
+	def _segments(self, text):
+		"""Generate (tokens, text) pairs for each run of visible text between annotation boundaries."""
+		active = []  # The end offset and token of each open enclosure.
+		cursor = 0
+		
+		for span, annotation in self(text):
+			start = span.start
+			
+			while active and active[-1][0] <= start:
+				stop = active[-1][0]
+				if cursor < stop:
+					yield tuple(token for _, token in active), text[cursor:stop]
+					cursor = stop
+				
+				active.pop()
+			
+			if cursor < start:
+				yield tuple(token for _, token in active), text[cursor:start]
+				cursor = start
+			
+			if isinstance(annotation, Token) and annotation.suffix is None:
+				yield tuple(token for _, token in active) + (annotation, ), text[start - len(annotation):start]
+			elif isinstance(annotation, Token):
+				active.append((span.stop, annotation))
+			else:
+				cursor = max(cursor, span.stop)
+		
+		while active:
+			stop = active[-1][0]
+			if cursor < stop:
+				yield tuple(token for _, token in active), text[cursor:stop]
+				cursor = stop
+			
+			active.pop()
+		
+		if cursor < len(text):
+			yield (), text[cursor:]
+	
+	def _scan(self, text):
+		"""Return an iterator of (offset, delimiter) pairs for each delimiter in the text."""
+		if not self.specialize or not self._delimiters:
+			return self._search(text)
+		
+		if self._scanner is None:
+			self._scanner = _specialize(self._delimiters)
+		
+		return self._scanner(text)
+	
+	def _search(self, text):
+		"""Generate (offset, delimiter) pairs for each delimiter in the text, preferring the longest at any offset."""
+		delimiters = self._delimiters
+		initials = set(delimiter[0] for delimiter in delimiters)
 		
-		# Version 1: exhaustive search.
 		i = 0
-
-		while i < len(text):
-			for token in self.tokens:
-				result = token(None, text, i)
-				if result:
-					i += len(token)
-					yield from result
+		length = len(text)
+		
+		while i < length:
+			if text[i] not in initials:
+				i += 1
+				continue
+			
+			for delimiter in delimiters:
+				if text.startswith(delimiter, i):
+					yield i, delimiter
+					i += len(delimiter)
 					break
+			
 			else:
 				i += 1
-
-
-
+	
+	def _annotate(self, matched):
+		"""Generate the nested annotation stream for a group of matched enclosures."""
+		enclosing = []
+		
+		for start, inner, close, end, token in sorted(matched, key=lambda m: m[0]):
+			while enclosing and enclosing[-1][0] <= start:
+				close_, end_ = enclosing.pop()
+				yield slice(close_, end_), "meta:invisible"
+			
+			yield slice(start, inner), "meta:invisible"
+			yield slice(inner, close), token
+			
+			if close != end:
+				enclosing.append((close, end))
+		
+		while enclosing:
+			close, end = enclosing.pop()
+			yield slice(close, end), "meta:invisible"
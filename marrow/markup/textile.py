@@ -3,21 +3,58 @@
 from __future__ import unicode_literals, print_function
 
 import string
+import codecs
 
-from cStringIO import StringIO
+from io import BytesIO, StringIO
 
 from functools import partial
+from xml.sax.saxutils import escape, quoteattr
 
 from marrow.util.convert import array
 from marrow.util.bunch import Bunch
 from marrow.tags import html5 as tag
 
+from marrow.markup.compat import unicode
+from marrow.markup.parser import Parser as InlineParser
+from marrow.markup.token import EnclosingToken
+
+
+class ViewReader(object):
+    """Iterate the lines of a memoryview, copying a block of it at a time rather than the whole buffer."""
+    
+    block = 65536
+    
+    def __init__(self, view):
+        self.view = view
+    
+    def seek(self, offset):
+        pass  # Iteration always starts from the beginning of the view.
+    
+    def __iter__(self):
+        view = self.view
+        remainder = b''
+        
+        for offset in range(0, len(view), self.block):
+            lines = (remainder + view[offset:offset + self.block].tobytes()).split(b'\n')
+            remainder = lines.pop()
+            
+            for line in lines:
+                yield line
+        
+        if remainder:
+            yield remainder
+
 
 class Signature(Bunch):
     def __repr__(self):
-        return b'Signature(' + str(self.block) + \
+        return str('Signature(' + self.block + \
                 ((', #' + self.id) if self.id else '') + \
-                ((', class="' + ', '.join(self.classes) + '"') if self.classes else '') + ')'
+                ((', class="' + ', '.join(self.classes) + '"') if self.classes else '') + ')')
+    
+    def key(self):
+        """Return a hashable summary of this signature, for use in cache keys."""
+        return (self.block, self.id, tuple(self.classes), tuple(self.styles), self.language, self.sticky,
+                self.continuous)
 
 
 class BlockRegistry(object):
@@ -28,164 +65,104 @@ class BlockRegistry(object):
         self.tokens.append((block, fn))
 
 
-class InlineToken(object):
+class InlineToken(EnclosingToken):
+    """Inline markup, which may only open at the start of the text or following whitespace."""
+    
     def __repr__(self):
         return "Token(%s)" % (self.tag, )
     
-    def __init__(self, start, end=None, tag=None):
-        super(InlineToken, self).__init__()
-        
-        self.start = start
-        self.end = end if end else start
-        self.tag = tag
+    @property
+    def tag(self):
+        return self.annotation
     
-    def validate(self, stream):
-        return stream[0] == self.start and stream.find(self.end, 1) > 1
+    def opens(self, text, offset):
+        return not offset or text[offset-1] in (' ', '\t')
     
-    def enter(self, stream):
-        yield stream
-        yield ('enter', self.tag())
+    def closes(self, text, offset):
+        return text[offset-1] != '\\'
     
-    def exit(self, stream):
-        yield stream
-        yield ('exit', None)
-
-
-class LongInlineToken(InlineToken):
-    def validate(self, stream):
-        return stream.startswith(self.start) and stream.find(self.end, len(self.start)) > 0
+    def elements(self, text, span):
+        """Return the (name, attributes) pairs of the elements to wrap around the enclosed text."""
+        return [(self.tag.name, [])]
 
 
-class UnformattedToken(LongInlineToken):
+class UnformattedToken(InlineToken):
     """No substitutions should appear within this token."""
     
-    def enter(self, stream):
-        end = 0
-        while True:
-            end = stream.index(self.end, end + 1)
-            if stream[end-1] != '\\':
-                break
-            
-            stream = stream[:end-1] + stream[end:]
-            end -= 1
-        
-        # print("\tSTREAM:", stream[end:])
-        # print('\tTEXT:', stream[:end])
-        yield stream[end:]
-        yield ('enter', self.tag())
-        yield ('text', stream[:end])
-    
-    def exit(self, stream):
-        yield stream
-        yield ('exit', None)
+    verbatim = True
+    
+    def text(self, text, span):
+        """Return the text to emit in place of the enclosed text."""
+        return text[span].replace('\\' + self.suffix, self.suffix)
 
 
 class LinkToken(InlineToken):
-    """No substitutions should appear within this token."""
+    """The link target follows the suffix, and ends at the first character that can not be part of a URL."""
     
-    def enter(self, stream):
-        #print("Entering link: {0!r}".format(stream))
-        yield stream
-        yield ('enter', self.tag())
+    linkbreak = string.ascii_letters + string.digits + '.-_:/@#'
     
-    def exit(self, stream):
-        linkbreak = string.ascii_letters + string.digits + '.-_:/@#'
-        l = len(stream)
+    def extent(self, text, end):
+        linkbreak = self.linkbreak
+        length = len(text)
         
-        for i, c in enumerate(stream):
-            if i+1 < len(stream) and stream[i+1] not in linkbreak and c in ('.', ':', '@'):
-                yield stream[i:]
-                yield ('attr', ('href', stream[:i]))
-                break
+        for i in range(end, length):
+            c = text[i]
+            
+            if i+1 < length and text[i+1] not in linkbreak and c in ('.', ':', '@'):
+                return i
             
             if c not in linkbreak:
-                yield stream[i:]
-                yield ('attr', ('href', stream[:i]))
-                break
+                return i
         
-        else:
-            if stream[-1] in ('.', ':', '@'):
-                yield stream[-1]
-                yield ('attr', ('href', stream[:-1]))
-            
-            else:
-                yield ""
-                yield ('attr', ('href', stream))
+        if end < length and text[-1] in ('.', ':', '@'):
+            return length - 1
         
-        yield ('exit', None)
+        return length
+    
+    def elements(self, text, span):
+        end = span.stop + len(self.suffix)
+        return [(self.tag.name, [('href', text[end:self.extent(text, end)])])]
 
 
-class FootnoteToken(InlineToken):
-    def enter(self, stream):
-        end = 0
-        while True:
-            end = stream.index(self.end, end + 1)
-            if stream[end-1] != '\\':
-                break
-            
-            stream = stream[:end-1] + stream[end:]
-            end -= 1
-        
-        fn = stream[:end]
+class FootnoteToken(UnformattedToken):
+    def text(self, text, span):
+        fn = super(FootnoteToken, self).text(text, span)
         if not fn.isdigit():
             # TODO: Store the footnote in the current parser and get index.
             fn = '0'
         
-        yield stream[end:]
-        yield ('enter', tag.sup())
-        yield ('enter', tag.a())
-        yield ('attr', ('href', '#fn' + fn))
-        yield ('attr', ('rel', 'footnote'))
-        yield ('text', fn)
-    
-    def exit(self, stream):
-        yield stream
-        yield ('exit', None) # a
-        yield ('exit', None) # sup
-
-
-class InlineRegistry(object):
-    def __init__(self):
-        super(InlineRegistry, self).__init__()
-        self.tokens = dict()
+        return fn
     
-    def register(self, token, symbol=None):
-        if symbol:
-            start, end = (symbol if isinstance(symbol, tuple) == 2 else (symbol, None))
-            token = InlineToken(start, end, token) if len(start) == 1 else LongInlineToken(start, end, token)
-        
-        if token.start[0] not in self.tokens:
-            self.tokens[token.start[0]] = []
-        
-        self.tokens[token.start[0]].append(token)
+    def elements(self, text, span):
+        return [('sup', []), ('a', [('href', '#fn' + self.text(text, span)), ('rel', 'footnote')])]
 
 
 class Parser(object):
     _blocks = BlockRegistry()
     
-    _blocks.register('ol', lambda _, __: _[0] == '#')
-    _blocks.register('ul', lambda _, __: _[0] in ('*', '-'))
-    _blocks.register('menu', lambda _, __: _[0] == ':')
+    _blocks.register('ol', lambda _, __: _[0] == '#' and Parser._item(_))
+    _blocks.register('ul', lambda _, __: _[0] in ('*', '-') and Parser._item(_))
+    _blocks.register('menu', lambda _, __: _[0] == ':' and Parser._item(_))
     _blocks.register('dl', lambda _, __: _[-1] == ':' and len(__) > 1 and __[1][0] in (' ', '\t'))
     _blocks.register('table', lambda _, __: _[0] == _[-1] == '|')
     _blocks.register('link', lambda _, __: _[0] == '[' and ']' in _ and '/' in _ and ' ' not in _)
     _blocks.register('footnote', lambda _, __: _[:2] == 'fn' and _.split('.', 1)[0][2:].isdigit())
     
-    _inline = InlineRegistry()
-    
-    _inline.register(tag.strong, '*')
-    _inline.register(tag.em, '_')
-    #_inline.register(tag.del_, '-')
-    #_inline.register(tag.ins, '+')
-    _inline.register(tag.span, '%')
-    _inline.register(tag.sup, '^')
-    _inline.register(tag.sub, '~')
-    _inline.register(tag.cite, '??')
-    _inline.register(tag.b, '**')
-    _inline.register(tag.i, '__')
-    _inline.register(UnformattedToken('@', tag=tag.code))
-    _inline.register(LinkToken('"', '":', tag=tag.a))
-    _inline.register(FootnoteToken('[', ']'))
+    _inline = InlineParser(specialize=True)
+    
+    _inline.add(InlineToken(tag.strong, '*'))
+    _inline.add(InlineToken(tag.em, '_'))
+    #_inline.add(InlineToken(tag.del_, '-'))
+    #_inline.add(InlineToken(tag.ins, '+'))
+    _inline.add(InlineToken(tag.span, '%'))
+    _inline.add(InlineToken(tag.sup, '^'))
+    _inline.add(InlineToken(tag.sub, '~'))
+    _inline.add(InlineToken(tag.cite, '??'))
+    _inline.add(InlineToken(tag.b, '**'))
+    _inline.add(InlineToken(tag.i, '__'))
+    _inline.add(UnformattedToken(tag.code, '@'))
+    _inline.add(LinkToken(tag.a, '"', '":'))
+    _inline.add(FootnoteToken(tag.sup, '[', ']'))
     
     _replacements = {
             ' - ': '–',
@@ -205,19 +182,193 @@ class Parser(object):
         )
     
     _lists = ('#', '*', '-', ':')
+    _headings = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+    _breaks = ('p', 'ul', 'ol', 'menu', 'li', 'dl', 'dt', 'dd', 'label', 'table', 'tr', 'th', 'td')
     
-    def __init__(self, input, encoding='utf-8'):
-        self._input = StringIO(input.encode('utf8')) if isinstance(input, unicode) else input
+    _align = {'<': 'left', '>': 'right', '=': 'center', '<>': 'justify'}
+    _valign = {'^': 'top', '-': 'middle', '~': 'bottom'}
+    
+    def __init__(self, input, encoding='utf-8', cache=None):
+        if isinstance(input, unicode):
+            input = StringIO(input)
+        
+        elif not self._compatible(encoding) and isinstance(input, (bytes, memoryview)):
+            # Line breaks can not be found by byte value; decode up-front instead.
+            input = codecs.getreader(encoding)(BytesIO(input.tobytes() if isinstance(input, memoryview) else input))
+        
+        elif isinstance(input, bytes):
+            input = BytesIO(input)
+        
+        elif isinstance(input, memoryview):
+            input = ViewReader(input)
+        
+        self._input = input
         self._encoding = encoding
+        self._cache = cache
         self._footnotes = []
         self._links = dict()
+        self._references = None  # Link names used while rendering, collected only when populating the cache.
     
     def render(self, *args, **kw):
+        if self._cache is not None:
+            return "".join(self._cached())
+        
         root = tag.div(strip=True)
         root.data = list(self(*args, **kw))
         return unicode(root)
     
     def __call__(self, *args, **kw):
+        for signature, chunk in self._classify():
+            for node in self._nodes(signature, chunk):
+                yield node
+    
+    def _nodes(self, signature, chunk):
+        """Return the element tree nodes for a single classified chunk.
+        
+        Blocks with a dedicated `_tree_<block>` builder use it, unless a subclass handles the block itself.
+        """
+        builder = getattr(self, '_tree_' + signature.block, None)
+        
+        if builder and not self._processor(signature.block):
+            return builder(chunk, signature=signature)
+        
+        return self._tree(self._block_events(signature, chunk))
+    
+    def _processor(self, block):
+        """Return the method a subclass defines to handle the given block, if any.
+        
+        Subclasses may handle a block by defining a method named after it, accepting the chunk and signature and
+        returning an element; this predates the event pipeline and is honoured when rendering and streaming.  Such
+        elements are opaque, so contribute nothing to plain text extraction.
+        """
+        if getattr(Parser, block, None) is not None:
+            return None
+        
+        return getattr(self, block, None)
+    
+    def _cached(self):
+        """Generate the rendered fragment for each block, reusing those held by the fragment cache.
+        
+        Fragments are keyed on the chunk, its signature and the targets of the named links it references, so blocks
+        are shared between documents whose link tables differ elsewhere.  The names a block references are recorded
+        in the cache, under the key of the chunk and signature alone, as it is first rendered.  The link table is read
+        in full beforehand.
+        """
+        cache = self._cache
+        links = self._links
+        
+        self._read_links()
+        
+        for signature, chunk in self._classify():
+            if signature.block == 'link':
+                continue
+            
+            key = (self.__class__, signature.key(), tuple(chunk))
+            names = cache.get(key)
+            fragment = None
+            
+            if names is not None:
+                fragment = cache.get(key + (tuple(links.get(name, '') for name in names), ))
+            
+            if fragment is None:
+                self._references = references = set()
+                
+                try:
+                    root = tag.div(strip=True)
+                    root.data = list(self._nodes(signature, chunk))
+                    fragment = unicode(root)
+                
+                finally:
+                    self._references = None
+                
+                names = cache[key] = tuple(sorted(references))
+                cache[key + (tuple(links.get(name, '') for name in names), )] = fragment
+            
+            yield fragment
+    
+    def events(self):
+        """Generate a flat stream of (kind, value) events for the document without building an element tree.
+        
+        Kinds are 'start' (the value is a (name, attributes) tuple, attributes being a list of (name, value)
+        pairs), 'text', 'end' (the value is the element name), 'flush' and 'node' (the value is the element returned
+        by a block processor defined by a subclass).  Chunking, signature detection, inline tokenizing and event
+        emission are chained generators; at most a single block is held in memory.
+        
+        Link references are emitted as callables, exactly as they are handed to the element tree by `__call__`.
+        """
+        for signature, chunk in self._classify():
+            for event in self._block_events(signature, chunk):
+                yield event
+    
+    def stream(self):
+        """Generate the rendered HTML for the document piece by piece.
+        
+        Link definitions are read ahead of time, so named links may be used before they are defined.
+        """
+        self._read_links()
+        return self._serialize(self.events())
+    
+    def plain(self):
+        """Extract the visible text of the document along with a structural outline.
+        
+        Returns a (text, outline) tuple.  The outline is a list of (offset, block, id) tuples, one for each heading
+        or identified block, offset being the position of the block's text within the returned text.  Markup events
+        are dropped as they are produced; no elements are constructed and nothing is serialized.
+        """
+        parts = []
+        outline = []
+        length = 0
+        
+        for signature, chunk in self._classify():
+            block = []
+            
+            for kind, value in self._block_events(signature, chunk):
+                if kind == 'text':
+                    block.append(value)
+                
+                elif block and block[-1] != "\n" and kind in ('start', 'end') and \
+                        (value if kind == 'end' else value[0]) in self._breaks:
+                    block.append("\n")
+            
+            block = "".join(block).rstrip()
+            
+            if not block:
+                continue
+            
+            if parts:
+                parts.append("\n\n")
+                length += 2
+            
+            if signature.id or signature.block in self._headings:
+                outline.append((length, signature.block, signature.id))
+            
+            parts.append(block)
+            length += len(block)
+        
+        return "".join(parts), outline
+    
+    def _read_links(self):
+        """Populate the link table from every link definition in the document, without rendering anything else."""
+        for signature, chunk in self._classify():
+            if signature.block == 'link':
+                self.link(chunk, signature=signature)
+    
+    def _block_events(self, signature, chunk):
+        """Return the event stream for a single classified chunk."""
+        processor = self._processor(signature.block)
+        if processor:
+            result = processor(chunk, signature=signature)
+            return [('node', result)] if result else []
+        
+        emitter = getattr(self, '_emit_' + signature.block, None)
+        if not emitter:
+            emitter = self._emit_default
+            chunk = self._unformat(chunk)
+        
+        return emitter(chunk, signature=signature)
+    
+    def _classify(self):
+        """Pair each chunk of input with the block signature it resolves to."""
         self._input.seek(0)
         
         signature, remainder = self._signature('first.')
@@ -228,7 +379,7 @@ class Parser(object):
                 signature = None
             
             try:
-                chunk = chunks.next()
+                chunk = next(chunks)
             except StopIteration:
                 return
             
@@ -269,24 +420,16 @@ class Parser(object):
             if signature.block[0] == '_':
                 raise Exception("Invalid block; stop trying to mess with the parser!")
             
-            processor = getattr(self, signature.block, None)
-            if not processor:
-                processor = self._default
-                chunk = self._unformat(chunk)
-            
-            result = processor(chunk, signature=signature)
-            
-            if result:
-                yield result
+            yield signature, chunk
     
     @property
     def _chunks(self):
         # Read until we reach a blank line or a line with leading whitespace.
+        # Byte input is split and tested for blank lines without decoding; each chunk is then decoded in one pass.
         chunk = []
         
-        for line in (l.rstrip('\n') for l in self._input):
-            if not isinstance(line, unicode):
-                line = line.decode(self._encoding)
+        for line in self._input:
+            line = line.rstrip(b'\n' if isinstance(line, bytes) else '\n')
             
             if not chunk and line:
                 chunk.append(line)
@@ -296,13 +439,24 @@ class Parser(object):
                 if not chunk:
                     continue
                 
-                yield chunk
+                yield self._decode(chunk)
                 chunk = []
                 continue
             
             chunk.append(line)
         
-        if chunk: yield chunk
+        if chunk: yield self._decode(chunk)
+    
+    def _decode(self, chunk):
+        if isinstance(chunk[0], unicode):
+            return chunk
+        
+        return b'\n'.join(chunk).decode(self._encoding).split('\n')
+    
+    @staticmethod
+    def _compatible(encoding):
+        """Determine if the structural characters of the given encoding share their ASCII byte values."""
+        return ' \t\n'.encode(encoding) == b' \t\n'
     
     def _signature(self, line):
         """Determine if this line is a block signature.
@@ -386,217 +540,307 @@ class Parser(object):
         
         return text
     
-    def _format(self, text):
-        """Perform inline element expantion."""
+    def _tree(self, events):
+        """Build elements from a stream of events, generating each top-level node once it is complete."""
+        stack = []
         
-        def tokenize(source):
-            source = source
-            
-            stack = []
-            tokens = self._inline.tokens
-            
-            while source:
-                for i, char in enumerate(source):
-                    token = stack[-1] if stack else None
-                    
-                    # if token: print("\tLooking for {0!r} at position {1} in {2!r}...".format(token.end, i, source))
-                    if token and source.find(token.end) == i:
-                        # print("\tFound.")
-                        
-                        if i > 0:
-                            if source[i-1] == '\\':
-                                # print("406:yielding:", source[:i])
-                                # print("407:source:", source[:i])
-                                yield 'text', source[:i-2] + char
-                                source = source[:i]
-                                break
-                            
-                            # print("412:yielding:", source[:i])
-                            # print("413:source:", source[i:])
-                            yield 'text', source[:i]
-                            source = source[i:]
-                            break
-                        
-                        emitter = token.exit(source[len(token.end):])
-                        source = emitter.next()
-                        # print("420:emitter:source:", source)
-                        
-                        for chunk in emitter:
-                            # print("422:chunk:", chunk)
-                            if chunk[0] == 'enter':
-                                stack.append(token)
-                            if chunk[0] == 'exit':
-                                stack.pop()
-                            
-                            yield chunk
-                        
-                        break
-                    
-                    if char not in tokens:
-                        continue
-                    
-                    remainder = source if i == 0 else source[i:]
-                    # print("437:remainder:", remainder)
-                    
-                    for token in tokens[char]:
-                        if token.validate(remainder):
-                            break
-                    else:
-                        continue
-                    
-                    if i > 0:
-                        if source[i-1] == '\\' or source[i-1] not in ' \t':
-                            # print("447:text:", source[:i] + char)
-                            # print("448:source:", source[i+1:])
-                            yield 'text', source[:i] + char
-                            source = source[i+1:]
-                            break
-                        
-                        # print("453:text:", source[:i])
-                        # print("454:source:", remainder)
-                        yield 'text', source[:i]
-                        source = remainder
-                        break
-                    
-                    emitter = token.enter(source[len(token.start):])
-                    source = emitter.next()
-                    # print("460:source:", source)
-                    
-                    for chunk in emitter:
-                        # print("462:chunk:", chunk)
-                        if chunk[0] == 'enter':
-                            stack.append(token)
-                        elif chunk[0] == 'exit':
-                            stack.pop()
-                        
-                        yield chunk
-                    
-                    break
+        for kind, value in events:
+            if kind == 'start':
+                name, attrs = value
+                value = getattr(tag, name)(**self._keywords(attrs))
+                
+                if stack:
+                    stack[-1].data.append(value)
                 
-                else:
-                    # print("477:overrun:", source, i, len(source))
-                    # print("478:stack:", stack)
-                    yield 'text', source
-                    break
-        
-        stack = [tag.span(strip=True)]
-        
-        for action, value in tokenize(text):
-            # print("Tokenized: {0} {1!r}".format(action, value))
-            if action == 'enter':
-                value = value()
-                stack[-1].data.append(value)
                 stack.append(value)
             
-            elif action == 'exit':
-                stack.pop()
-            
-            elif action == 'attr':
-                name, value = value
-                if name == 'href':
-                    if value[0] not in ('#', '/') and ':' not in value:
-                        value = self._get_link(value)
+            elif kind == 'end':
+                value = stack.pop()
                 
-                stack[-1].attrs[name] = value
+                if not stack:
+                    yield value
             
-            else:
+            elif kind == 'flush':
+                yield tag.flush
+            
+            elif stack:
                 stack[-1].data.append(value)
-        
-        return stack[0]
+            
+            else:
+                yield value
     
     def _get_link(self, name):
         def inner(context):
+            if self._references is not None:
+                self._references.add(name)
+            
             return self._links.get(name, '')
         
         return inner
     
-    def _default(self, text, signature):
-        node = getattr(tag, self._short.get(signature.block, signature.block))()
+    def _inline_events(self, text):
+        """Generate start/text/end events for the inline markup of the given text.
         
-        return node(
-                id_ = signature.id or None,
-                class_ = ' '.join(signature.classes) or None,
-                style = '; '.join(signature.styles) or None
-            )[ self._format(text) ]
-    
-    def list(self, chunk, signature, kind='ul'):
-        parent = getattr(tag, kind)
-        stack = []
-        indentation = 0
+        This consumes the annotation stream of the inline parser: invisible annotations are skipped over, and each
+        token annotation is wrapped in the elements the token describes.
+        """
+        stack = []  # The end offset and element names of each open token.
+        cursor = 0
         
-        for line in chunk:
-            if line.lstrip()[0] not in ('#', '*', '-', ':'):
-                stack[-1].data[-1].data.append(line)
+        for span, annotation in self._inline(text):
+            start = span.start
             
-            if line[0] in (' ', '\t'):
-                # Determine indentation level.
-                level = len(line) - len(line.lstrip())
+            while stack and stack[-1][0] <= start:
+                stop, names = stack.pop()
                 
-                if level > indentation:
-                    node = parent()
-                    if stack: stack[-1][0].data.append(node)
-                    stack.append((node, level))
+                if cursor < stop:
+                    yield 'text', text[cursor:stop]
+                    cursor = stop
                 
-                elif level < indentation:
-                    for i, element in enumerate(stack):
-                        if element[1] == level:
-                            break
-                    
-                    else:
-                        raise Exception("Unknown list level.")
-                    
-                    del stack[i]
+                for name in reversed(names):
+                    yield 'end', name
+            
+            if cursor < start:
+                yield 'text', text[cursor:start]
+                cursor = start
+            
+            if not isinstance(annotation, EnclosingToken):
+                cursor = max(cursor, span.stop)
+                continue
+            
+            names = []
+            
+            for name, attrs in annotation.elements(text, span):
+                for i, (attr, value) in enumerate(attrs):
+                    if attr == 'href' and value[:1] not in ('#', '/') and ':' not in value:
+                        attrs[i] = (attr, self._get_link(value))
                 
-                indentation = level
-                line = line.lstrip()
+                names.append(name)
+                yield 'start', (name, attrs)
             
-            symbols, _, line = line.partition(' ')
+            if annotation.verbatim:
+                yield 'text', annotation.text(text, span)
+                cursor = span.stop
             
-            if len(symbols) > len(stack) + 1:
-                raise Exception("Attempted to skip list level.")
+            stack.append((span.stop, names))
+        
+        while stack:
+            stop, names = stack.pop()
             
-            if len(symbols) > len(stack):
-                node = parent()
-                if stack: stack[-1][0].data.append(node)
-                stack.append((node, indentation))
+            if cursor < stop:
+                yield 'text', text[cursor:stop]
+                cursor = stop
             
-            stack[-1][0].data.append(tag.li[self._format(line)])
+            for name in reversed(names):
+                yield 'end', name
         
-        return stack[0][0](id_=signature.id or None, class_=' '.join(signature.classes) or None, style='; '.join(signature.styles) or None)
+        if cursor < len(text):
+            yield 'text', text[cursor:]
     
-    def ul(self, chunk, signature):
-        return self.list(chunk, signature, 'ul')
+    def _attributes(self, signature):
+        """Return the (name, value) attribute pairs described by a block signature."""
+        attrs = []
+        
+        if signature.id:
+            attrs.append(('id', signature.id))
+        
+        if signature.classes:
+            attrs.append(('class', ' '.join(signature.classes)))
+        
+        if signature.styles:
+            attrs.append(('style', '; '.join(signature.styles)))
+        
+        return attrs
     
-    def ol(self, chunk, signature):
-        return self.list(chunk, signature, 'ol')
+    @staticmethod
+    def _serialize(events):
+        """Generate HTML source from a stream of events."""
+        for kind, value in events:
+            if kind == 'text':
+                yield escape(value)
+            
+            elif kind == 'start':
+                name, attrs = value
+                yield '<' + name + ''.join(
+                        ' ' + attr + '=' + quoteattr(data(None) if callable(data) else data)
+                        for attr, data in attrs
+                    ) + '>'
+            
+            elif kind == 'end':
+                yield '</' + value + '>'
+            
+            elif kind == 'node':
+                yield escape(value) if isinstance(value, unicode) else unicode(value)
     
-    def menu(self, chunk, signature):
-        return self.list(chunk, signature, 'menu')
+    @staticmethod
+    def _item(line):
+        """Split a list item into its (marker, text), returning None if the line is not a list item."""
+        marker, _, text = line.lstrip().partition(' ')
+        
+        if not marker or marker.strip('#*-:'):
+            return None
+        
+        return marker, text
     
-    def dl(self, chunk, signature):
-        dl = tag.dl()
+    def _list_levels(self, chunk):
+        """Generate (level, text) pairs for each line of a list, levels starting at one.
+        
+        Nesting is the sum of the number of leading list symbols and the number of indentation steps; tabs count to
+        the next multiple of four columns.  Levels may not be skipped, and dedents to a width never seen before fall
+        back to the nearest enclosing level.  Each indentation width remembers the nesting it was first given, so
+        sibling items at the same width share a level.  Lines which are not list items continue the previous item and
+        are given a level of None; if no item has been started yet such a line starts one.
+        """
+        indents = [(0, 0)]  # The (width, nesting) of each open indentation step, nesting excluding list symbols.
+        level = 0
         
         for line in chunk:
-            if line[0] not in (' ', '\t'):
-                dl.data.append(tag.dt[self._format(line[:-1])])
+            stripped = line.lstrip()
+            item = self._item(stripped)
+            
+            if not item:
+                if not level:
+                    level = 1
+                    yield level, stripped
+                    continue
+                
+                yield None, stripped
+                continue
+            
+            marker, text = item
+            indent = len(line) - len(stripped)
+            if indent and '\t' in line[:indent]:
+                indent = len(line[:indent].expandtabs(4))
+            
+            dedent = indent < indents[-1][0]
+            while indent < indents[-1][0]:
+                indents.pop()
+            
+            width, nesting = indents[-1]
+            level = max(1, min(nesting + (indent > width and not dedent) + len(marker), level + 1))
+            
+            if indent > width:
+                indents.append((indent, level - len(marker)))
+            
+            yield level, text
+    
+    def _table_spec(self, spec):
+        """Parse a table row or cell attribute specification, returning (header, attributes) or None.
+        
+        Valid specifications combine:  _ (header cell), \\n (column span), /n (row span), < > = <> (horizontal
+        alignment), ^ - ~ (vertical alignment), (class#id) and {style:value;...}.
+        """
+        header = False
+        attrs = []
+        styles = []
+        i = 0
+        
+        while i < len(spec):
+            char = spec[i]
+            
+            if char == '_':
+                header = True
+                i += 1
+            
+            elif char in ('\\', '/'):
+                end = i + 1
+                while end < len(spec) and spec[end].isdigit():
+                    end += 1
+                
+                if end == i + 1:
+                    return None
+                
+                attrs.append(('colspan' if char == '\\' else 'rowspan', spec[i + 1:end]))
+                i = end
+            
+            elif spec.startswith('<>', i):
+                styles.append('text-align: ' + self._align['<>'])
+                i += 2
+            
+            elif char in self._align:
+                styles.append('text-align: ' + self._align[char])
+                i += 1
+            
+            elif char in self._valign:
+                styles.append('vertical-align: ' + self._valign[char])
+                i += 1
+            
+            elif char in ('(', '{'):
+                end = spec.find(')' if char == '(' else '}', i)
+                if end < 0:
+                    return None
+                
+                if char == '(':
+                    classes, _, identifier = spec[i + 1:end].partition('#')
+                    if identifier:
+                        attrs.append(('id', identifier.strip()))
+                    if classes.strip():
+                        attrs.append(('class', ' '.join(classes.split())))
+                
+                else:
+                    styles.extend(array(spec[i + 1:end], ';'))
+                
+                i = end + 1
+            
             else:
-                dl.data.append(tag.dd[self._format(line.lstrip())])
+                return None
+        
+        if styles:
+            attrs.append(('style', '; '.join(styles)))
         
-        return dl
+        return header, attrs
     
-    def pre(self, chunk, signature):
-        return tag.pre(
-                id_ = signature.id or None,
-                class_ = ' '.join(signature.classes) or None,
-                style = '; '.join(signature.styles) or None
-            )[ "\n".join(chunk) ]
+    def _table_cells(self, line, start):
+        """Generate (header, attributes, text) for each cell of a row, splitting on unescaped pipes."""
+        end = len(line)
+        
+        while start < end:
+            i = line.find('|', start)
+            while i > 0 and line[i - 1] == '\\':
+                i = line.find('|', i + 1)
+            
+            if i < 0:
+                i = end
+            
+            text = line[start:i]
+            start = i + 1
+            
+            if '\\|' in text:
+                text = text.replace('\\|', '|')
+            
+            header, attrs = False, []
+            
+            if '. ' in text or text.endswith('.'):
+                spec, _, remainder = text.partition('.')
+                spec = self._table_spec(spec) if spec else None
+                
+                if spec:
+                    (header, attrs), text = spec, remainder.lstrip()
+            
+            yield header, attrs, text
     
-    def code(self, chunk, signature):
-        signature.classes.insert(0, 'code')
-        return self.pre(chunk, signature)
+    def _table_rows(self, chunk):
+        """Generate (attributes, cells) for each row of a table; cells are generated lazily."""
+        for line in chunk:
+            line = line.strip()
+            attrs = []
+            
+            if not line:
+                continue
+            
+            if line[0] != '|':
+                spec, _, remainder = line.partition('.')
+                spec = self._table_spec(spec) if spec else None
+                
+                if spec and remainder.lstrip()[:1] == '|':
+                    attrs, line = spec[1], remainder.lstrip()
+            
+            yield attrs, self._table_cells(line, 1 if line[0] == '|' else 0)
     
-    def table(self, chunk, signature):
-        return "TABLE"
+    @staticmethod
+    def _keywords(attrs):
+        """Transform (name, value) attribute pairs into keyword arguments for tag construction."""
+        return dict(((name + '_') if name in ('id', 'class') else name, value) for name, value in attrs)
     
     def link(self, chunk, signature):
         for line in chunk:
@@ -605,35 +849,177 @@ class Parser(object):
         
         return ""
     
-    def flush(self, chunk, signature):
-        return tag.flush
+    def _emit_default(self, text, signature):
+        name = self._short.get(signature.block, signature.block)
+        
+        yield 'start', (name, self._attributes(signature))
+        
+        for event in self._inline_events(text):
+            yield event
+        
+        yield 'end', name
     
-    def bq(self, chunk, signature):
-        paragraphs = [[]]
+    def _emit_list(self, chunk, signature, kind='ul'):
+        depth = 0
         
-        for line in chunk:
-            if not line.strip():
-                paragraphs.append([])
+        for level, line in self._list_levels(chunk):
+            if level is None:
+                # Continuation of the previous item.
+                yield 'text', ' '
+                
+                for event in self._inline_events(line):
+                    yield event
+                
                 continue
             
-            paragraphs[-1].append(line)
+            if level > depth:
+                yield 'start', (kind, self._attributes(signature) if not depth else [])
+                depth += 1
+            
+            else:
+                yield 'end', 'li'
+                
+                while depth > level:
+                    yield 'end', kind
+                    yield 'end', 'li'
+                    depth -= 1
+            
+            yield 'start', ('li', [])
+            
+            for event in self._inline_events(line):
+                yield event
+        
+        while depth:
+            yield 'end', 'li'
+            yield 'end', kind
+            depth -= 1
+    
+    def _emit_ul(self, chunk, signature):
+        return self._emit_list(chunk, signature, 'ul')
+    
+    def _emit_ol(self, chunk, signature):
+        return self._emit_list(chunk, signature, 'ol')
+    
+    def _emit_menu(self, chunk, signature):
+        return self._emit_list(chunk, signature, 'menu')
+    
+    def _emit_dl(self, chunk, signature):
+        yield 'start', ('dl', [])
+        
+        for line in chunk:
+            name = 'dt' if line[0] not in (' ', '\t') else 'dd'
+            
+            yield 'start', (name, [])
+            
+            for event in self._inline_events(line[:-1] if name == 'dt' else line.lstrip()):
+                yield event
+            
+            yield 'end', name
+        
+        yield 'end', 'dl'
+    
+    def _emit_pre(self, chunk, signature):
+        yield 'start', ('pre', self._attributes(signature))
+        
+        for i, line in enumerate(chunk):
+            yield 'text', ("\n" + line) if i else line
+        
+        yield 'end', 'pre'
+    
+    def _emit_code(self, chunk, signature):
+        signature.classes.insert(0, 'code')
+        return self._emit_pre(chunk, signature)
+    
+    def _emit_table(self, chunk, signature):
+        yield 'start', ('table', self._attributes(signature))
+        
+        for attrs, cells in self._table_rows(chunk):
+            for event in self._row_events(attrs, cells):
+                yield event
+        
+        yield 'end', 'table'
+    
+    def _row_events(self, attrs, cells):
+        """Generate the events for a single table row."""
+        yield 'start', ('tr', attrs)
+        
+        for header, attrs, text in cells:
+            name = 'th' if header else 'td'
+            
+            yield 'start', (name, attrs)
+            
+            for event in self._inline_events(text):
+                yield event
+            
+            yield 'end', name
         
-        return tag.blockquote(
-                id_ = signature.id or None,
-                class_ = ' '.join(signature.classes) or None,
-                style = '; '.join(signature.styles) or None
-            )[ ( tag.p[self._format(self._unformat(p))] for p in paragraphs ) \
-                    if len(paragraphs) > 1 else self._format(self._unformat(paragraphs[0])) ]
+        yield 'end', 'tr'
     
-    def page(self, chunk, signature):
-        return "\f"
+    def _tree_table(self, chunk, signature):
+        """Build a table element whose rows are generated as it is serialized, rather than held up front."""
+        def rows():
+            for attrs, cells in self._table_rows(chunk):
+                for node in self._tree(self._row_events(attrs, cells)):
+                    yield node
+        
+        return [tag.table(**self._keywords(self._attributes(signature)))[ rows() ]]
+    
+    def _emit_link(self, chunk, signature):
+        self.link(chunk, signature)
+        return []
     
-    def footnote(self, chunk, signature):
+    def _emit_flush(self, chunk, signature):
+        return [('flush', None)]
+    
+    def _emit_bq(self, chunk, signature):
+        yield 'start', ('blockquote', self._attributes(signature))
+        
+        if all(line.strip() for line in chunk):
+            for event in self._inline_events(self._unformat(chunk)):
+                yield event
+        
+        else:
+            paragraph = []
+            
+            for line in chunk + ['']:
+                if line.strip():
+                    paragraph.append(line)
+                    continue
+                
+                yield 'start', ('p', [])
+                
+                for event in self._inline_events(self._unformat(paragraph)):
+                    yield event
+                
+                yield 'end', 'p'
+                paragraph = []
+        
+        yield 'end', 'blockquote'
+    
+    def _emit_page(self, chunk, signature):
+        return [('text', "\f")]
+    
+    def _emit_footnote(self, chunk, signature):
         level, _, chunk[0] = chunk[0].partition('.')
         
-        return tag.blockquote(
-                id_ = signature.id or level,
-                class_ = 'footnote' + (' ' + ' '.join(signature.classes) or ''),
-                style = '; '.join(signature.styles) or None,
-                rev = "footnote"
-            )[ [tag.label["Footnote " + level[2:]]] + [tag.p[self._format(i)] for i in chunk if i.strip()] ]
+        attrs = self._attributes(signature)
+        attrs = [('id', signature.id or level), ('class', ' '.join(['footnote'] + signature.classes))] + \
+                [i for i in attrs if i[0] == 'style'] + [('rev', "footnote")]
+        
+        yield 'start', ('blockquote', attrs)
+        yield 'start', ('label', [])
+        yield 'text', "Footnote " + level[2:]
+        yield 'end', 'label'
+        
+        for line in chunk:
+            if not line.strip():
+                continue
+            
+            yield 'start', ('p', [])
+            
+            for event in self._inline_events(line):
+                yield event
+            
+            yield 'end', 'p'
+        
+        yield 'end', 'blockquote'
@@ -9,21 +9,43 @@ class Token(object):
 	
 	def __len__(self):
 		return self.length
+	
+	def finditer(self, text, start=0, end=None):
+		"""Generate a tuple of the slices annotated by each match within text[start:end], from left to right."""
+		end = len(text) if end is None else end
+		i = start
+		
+		while i < end:
+			result = self(None, text, i)
+			if not result:
+				i += 1
+				continue
+			
+			spans = tuple(span for span, annotation in result)
+			yield spans
+			i = max(spans[-1].stop, i + 1)
 
 class InlineToken(Token):
 	"""Inline token definition."""
 	
-	__slots__ = ('annotation', 'match')
+	__slots__ = ('annotation', 'match', 'length')
+	
+	suffix = None  # Inline tokens stand alone; they do not enclose text.
 	
 	def __init__(self, annotation, match):
 		self.annotation = annotation if isinstance(annotation, set) else ({annotation} if isinstance(annotation, str) else set(annotation))
 		self.match = match
+		self.length = len(match)
+	
+	@property
+	def prefix(self):
+		return self.match
 	
 	def __call__(self, context, stream, offset):
 		match = self.match
 		length = len(match)
 		
-		if not offset.startswith(match):
+		if not stream.startswith(match, offset):
 			return
 		
 		def inline_token_generator():
@@ -31,6 +53,16 @@ class InlineToken(Token):
 			yield slice(offset + length, 0), self
 		
 		return inline_token_generator()
+	
+	def finditer(self, text, start=0, end=None):
+		"""Generate a (match, ) tuple of slices for each occurrence within text[start:end]."""
+		match = self.match
+		end = len(text) if end is None else end
+		offset = text.find(match, start, end)
+		
+		while offset >= 0:
+			yield (slice(offset, offset + self.length), )
+			offset = text.find(match, offset + self.length, end)
 
 class EnclosingToken(Token):
 	"""Token definition for tokens which surround other text."""
@@ -38,15 +70,29 @@ class EnclosingToken(Token):
 	
 	__slots__ = ('annotation', 'prefix', 'suffix', 'length')  # Don't construct a new __dict__ for each instance.
 	
+	verbatim = False  # If true, the enclosed text is not searched for further tokens.
+	
 	def __init__(self, annotation, prefix, suffix=None):
 		self.annotation = annotation
 		self.prefix = prefix
-		self.suffix = suffix
+		self.suffix = prefix if suffix is None else suffix
 		self.length = len(prefix)
 	
 	def __repr__(self):
 		return "Token({}, {}, {})".format(self.annotation, self.prefix, self.suffix)
 	
+	def opens(self, text, offset):
+		"""Determine if the prefix found at the given offset may open this token."""
+		return True
+	
+	def closes(self, text, offset):
+		"""Determine if the suffix found at the given offset may close this token."""
+		return True
+	
+	def extent(self, text, end):
+		"""Return the end of the trailing text consumed along with the suffix ending at the given offset."""
+		return end
+	
 	def __call__(self, context, stream, offset):
 		length = self.length
 		end = stream.find(self.suffix, offset+length)
@@ -62,16 +108,43 @@ class EnclosingToken(Token):
 		
 		return enclosing_token_generator()
 	
-	def partition(self, text):
-		for i in range(len(text)):
-			result = list(self(None, text, i))
-			if result:
-				break
+	def finditer(self, text, start=0, end=None):
+		"""Generate a (prefix, enclosed, suffix) tuple of slices for each match within text[start:end].
 		
-		pl = i - 1
-		(pr, pa), (tr, ta), (sr, sa) = result
+		Matches are found in a single left-to-right pass; each prefix is paired with the next acceptable suffix, unless
+		that would leave the enclosure empty, in which case the search resumes from the next prefix.
+		"""
+		prefix, suffix = self.prefix, self.suffix
+		end = len(text) if end is None else end
+		find = text.find
 		
-		return (text[:pl], text[tr], text[sr.stop:])
-
-
-
+		offset = find(prefix, start, end)
+		
+		while offset >= 0:
+			if not self.opens(text, offset):
+				offset = find(prefix, offset + 1, end)
+				continue
+			
+			inner = offset + self.length
+			close = find(suffix, inner, end)
+			while close >= 0 and not self.closes(text, close):
+				close = find(suffix, close + 1, end)
+			
+			if close < 0:
+				return
+			
+			if close == inner:  # Enclosures may not be empty; as with the parser, a later prefix may open instead.
+				offset = find(prefix, offset + 1, end)
+				continue
+			
+			stop = min(self.extent(text, close + len(suffix)), end)
+			yield slice(offset, inner), slice(inner, close), slice(close, stop)
+			
+			offset = find(prefix, stop, end)
+	
+	def partition(self, text):
+		"""Split text around the first match, returning (before, enclosed, after) or (text, '', '') if none."""
+		for prefix, enclosed, suffix in self.finditer(text):
+			return text[:prefix.start], text[enclosed], text[suffix.stop:]
+		
+		return text, text[:0], text[:0]
@@ -95,6 +95,9 @@ setup(
 	# ## Plugin Registration
 	
 	entry_points = {
+			'console_scripts': [
+					'markup = marrow.markup.__main__:main',
+				],
 			},
 	
 	zip_safe = True,
@@ -0,0 +1,50 @@
+# encoding: utf-8
+
+from marrow.markup.cache import FragmentCache
+
+
+class TestFragmentCache(object):
+	def test_miss(self):
+		cache = FragmentCache()
+		assert cache.get('a') is None
+		assert cache.get('a', '') == ''
+		assert 'a' not in cache
+
+	def test_reuse(self):
+		cache = FragmentCache()
+		cache['a'] = '<p>a</p>'
+		assert cache.get('a') == '<p>a</p>'
+		assert 'a' in cache
+		assert len(cache) == 1
+
+	def test_replace(self):
+		cache = FragmentCache()
+		cache['a'] = '<p>a</p>'
+		cache['a'] = '<p>b</p>'
+		assert cache.get('a') == '<p>b</p>'
+		assert len(cache) == 1
+
+	def test_eviction(self):
+		cache = FragmentCache(2)
+		cache['a'] = 1
+		cache['b'] = 2
+		cache['c'] = 3
+		assert len(cache) == 2
+		assert 'a' not in cache
+		assert cache.get('b') == 2
+		assert cache.get('c') == 3
+
+	def test_eviction_is_least_recently_used(self):
+		cache = FragmentCache(2)
+		cache['a'] = 1
+		cache['b'] = 2
+		cache.get('a')
+		cache['c'] = 3
+		assert 'a' in cache
+		assert 'b' not in cache
+
+	def test_clear(self):
+		cache = FragmentCache()
+		cache['a'] = 1
+		cache.clear()
+		assert len(cache) == 0
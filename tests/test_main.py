@@ -0,0 +1,103 @@
+# encoding: utf-8
+
+import os
+import json
+import hashlib
+
+import pytest
+
+from marrow.markup.release import version
+from marrow.markup.__main__ import main, _load
+
+
+SOURCE = b"h1. Hello\n\nSome *text*.\n"
+OPTIONS = dict(encoding='utf-8')
+
+
+def manifest(path, **kw):
+	data = dict(version=version, options=OPTIONS, files={})
+	data.update(kw)
+
+	with open(str(path), 'w') as fh:
+		json.dump(data, fh)
+
+	return str(path)
+
+
+class TestManifest(object):
+	def test_load(self, tmpdir):
+		path = manifest(tmpdir.join('.markup.json'), files={'a.textile': 'abc'})
+		assert _load(path, OPTIONS) == {'a.textile': 'abc'}
+
+	def test_missing(self, tmpdir):
+		assert _load(str(tmpdir.join('.markup.json')), OPTIONS) == {}
+
+	def test_invalid(self, tmpdir):
+		path = tmpdir.join('.markup.json')
+		path.write("not json")
+		assert _load(str(path), OPTIONS) == {}
+
+	def test_version_changed(self, tmpdir):
+		path = manifest(tmpdir.join('.markup.json'), version='0.0', files={'a.textile': 'abc'})
+		assert _load(path, OPTIONS) == {}
+
+	def test_options_changed(self, tmpdir):
+		path = manifest(tmpdir.join('.markup.json'), files={'a.textile': 'abc'})
+		assert _load(path, dict(encoding='latin-1')) == {}
+
+	def test_legacy(self, tmpdir):
+		path = tmpdir.join('.markup.json')
+		path.write(json.dumps({'a.textile': 'abc'}))
+		assert _load(str(path), OPTIONS) == {}
+
+
+class TestMain(object):
+	def test_unchanged_files_are_skipped(self, tmpdir, capsys):
+		tmpdir.join('page.textile').write_binary(SOURCE)
+		tmpdir.join('page.html').write("<h1>Previous</h1>")
+		path = manifest(tmpdir.join('.markup.json'), files={'page.textile': hashlib.sha1(SOURCE).hexdigest()})
+
+		assert main([str(tmpdir), '-j', '1']) == 0
+		assert "0 converted, 1 unchanged, 0 failed" in capsys.readouterr()[0]
+		assert tmpdir.join('page.html').read() == "<h1>Previous</h1>"
+
+		with open(path) as fh:
+			assert json.load(fh)['files'] == {'page.textile': hashlib.sha1(SOURCE).hexdigest()}
+
+	def test_manifest_is_always_written(self, tmpdir):
+		assert main([str(tmpdir), '-j', '1']) == 0
+
+		with open(str(tmpdir.join('.markup.json'))) as fh:
+			assert json.load(fh) == dict(version=version, options=OPTIONS, files={})
+
+	def test_permissions(self, tmpdir):
+		umask = os.umask(0o022)
+
+		try:
+			assert main([str(tmpdir), '-j', '1']) == 0
+		finally:
+			os.umask(umask)
+
+		assert os.stat(str(tmpdir.join('.markup.json'))).st_mode & 0o777 == 0o644
+
+	def test_conversion(self, tmpdir, capsys):
+		pytest.importorskip('marrow.util')
+		pytest.importorskip('marrow.tags')
+
+		from marrow.markup.textile import Parser
+
+		tmpdir.join('page.textile').write_binary(SOURCE)
+		tmpdir.join('sub').mkdir().join('other.textile').write_binary(SOURCE)
+		tmpdir.join('sub', 'other.html').write("<h1>Previous</h1>")
+		os.chmod(str(tmpdir.join('sub', 'other.html')), 0o640)
+
+		assert main([str(tmpdir), '-j', '1']) == 0
+		assert "2 converted, 0 unchanged, 0 failed" in capsys.readouterr()[0]
+
+		expected = Parser(SOURCE).render().encode('utf-8')
+		assert tmpdir.join('page.html').read_binary() == expected
+		assert tmpdir.join('sub', 'other.html').read_binary() == expected
+		assert os.stat(str(tmpdir.join('sub', 'other.html'))).st_mode & 0o777 == 0o640
+
+		assert main([str(tmpdir), '-j', '1']) == 0
+		assert "0 converted, 2 unchanged, 0 failed" in capsys.readouterr()[0]
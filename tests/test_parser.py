@@ -0,0 +1,144 @@
+# encoding: utf-8
+
+import pytest
+
+from marrow.markup.parser import Parser
+from marrow.markup.token import InlineToken, EnclosingToken
+
+
+strong = EnclosingToken('strong', '*')
+em = EnclosingToken('em', '_')
+bold = EnclosingToken('b', '**')
+link = EnclosingToken('link', '[', ']')
+dash = InlineToken('dash', '--')
+
+
+def parser(*tokens, **kw):
+	result = Parser(**kw)
+
+	for token in tokens:
+		result.add(token)
+
+	return result
+
+
+def enclosed(parser, text):
+	"""Reduce the annotation stream to the (text, annotation) of each enclosure, omitting delimiters."""
+	return [(text[span], annotation.annotation) for span, annotation in parser(text) if annotation != "meta:invisible"]
+
+
+class TestPairing(object):
+	def test_plain(self):
+		assert list(parser(strong, em)("plain text")) == []
+
+	def test_simple(self):
+		text = "a *b* c"
+		assert list(parser(strong)(text)) == [
+				(slice(2, 3), "meta:invisible"),
+				(slice(3, 4), strong),
+				(slice(4, 5), "meta:invisible"),
+			]
+
+	def test_nesting(self):
+		assert enclosed(parser(strong, em), "*though _simple_*") == [("though _simple_", 'strong'), ("simple", 'em')]
+
+	def test_crossed(self):
+		# The inner opener is discarded when the outer enclosure closes across it.
+		assert enclosed(parser(strong, em), "*a _b* c_") == [("a _b", 'strong')]
+		assert enclosed(parser(strong, em), "_a *b_ c*") == [("a *b", 'em')]
+
+	@pytest.mark.parametrize('text', ["**", "a * b", "*", "a*"])
+	def test_unmatched(self, text):
+		assert list(parser(strong)(text)) == []
+
+	def test_empty_rejected(self):
+		# The empty pair is skipped; the second delimiter instead opens the enclosure.
+		assert enclosed(parser(strong), "**a*") == [("a", 'strong')]
+		assert enclosed(parser(link), "[] [a]") == [("a", 'link')]
+
+	@pytest.mark.parametrize('text', ["**a*", "[] [a]", "*a* [b] **c*", "** x"])
+	def test_finditer_agrees(self, text):
+		tokens = (strong, link)
+		found = sorted((text[spans[1]], token.annotation) for token in tokens for spans in token.finditer(text))
+		assert sorted(enclosed(parser(*tokens), text)) == found
+
+	def test_longest_delimiter(self):
+		assert enclosed(parser(strong, bold), "**a**") == [("a", 'b')]
+		assert enclosed(parser(strong, bold), "**a*") == []
+		assert enclosed(parser(strong, bold), "*a*") == [("a", 'strong')]
+
+	def test_sequential(self):
+		assert enclosed(parser(strong, em), "*a* _b_ *c*") == [("a", 'strong'), ("b", 'em'), ("c", 'strong')]
+
+
+class TestSplit(object):
+	def test_plain(self):
+		assert list(parser(strong)("plain")) == []
+		assert list(parser(strong).split("plain")) == [((), "plain")]
+
+	def test_nesting(self):
+		assert list(parser(strong, em).split("a *b _c_ d* e")) == [
+				((), "a "),
+				((strong, ), "b "),
+				((strong, em), "c"),
+				((strong, ), " d"),
+				((), " e"),
+			]
+
+	def test_marks(self):
+		assert list(parser(strong, dash).split("x -- *y*")) == [
+				((), "x "),
+				((dash, ), "--"),
+				((), " "),
+				((strong, ), "y"),
+			]
+
+	def test_nested_marks(self):
+		assert list(parser(strong, dash).split("*a -- b*")) == [
+				((strong, ), "a "),
+				((strong, dash), "--"),
+				((strong, ), " b"),
+			]
+
+	def test_adjacent_marks(self):
+		assert list(parser(dash).split("----")) == [((dash, ), "--"), ((dash, ), "--")]
+
+
+class TestSpecialize(object):
+	tokens = (strong, em, bold, dash, EnclosingToken('link', '[', ']'), EnclosingToken('code', '@'))
+
+	@pytest.mark.parametrize('text', [
+			"",
+			"plain text",
+			"*a* _b_ **c** [d] @e@ f -- g",
+			"***a***__b__--- [[x]] @@",
+			"*though _simple_*",
+			"*a _b* c_",
+			"trailing *",
+		])
+	def test_equivalence(self, text):
+		generic = parser(*self.tokens)
+		specialized = parser(*self.tokens, specialize=True)
+
+		assert list(specialized._scan(text)) == list(generic._search(text))
+		assert list(specialized(text)) == list(generic(text))
+
+	def test_shared(self):
+		first = parser(strong, em, specialize=True)
+		second = parser(em, strong, specialize=True)
+		list(first("*a*"))
+		list(second("*a*"))
+
+		assert first._delimiters == second._delimiters == ('*', '_')
+		assert first._scanner is second._scanner
+
+	def test_canonical_order(self):
+		assert parser(em, dash, strong, bold)._delimiters == ('**', '--', '*', '_')
+
+	def test_bounded(self):
+		from marrow.markup.parser import _scanners
+
+		for n in range(_scanners.size + 10):
+			list(parser(EnclosingToken('t', '~' * (n + 1)), specialize=True)("~"))
+
+		assert len(_scanners) == _scanners.size
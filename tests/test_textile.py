@@ -0,0 +1,277 @@
+# encoding: utf-8
+
+import pytest
+
+pytest.importorskip('marrow.util')
+pytest.importorskip('marrow.tags')
+
+from marrow.markup.compat import unicode
+from marrow.markup.textile import Parser
+
+
+def render(text):
+	return Parser(text).render()
+
+
+def stream(text):
+	return ''.join(Parser(text).stream())
+
+
+class TestEvents(object):
+	def test_inline(self):
+		assert list(Parser("h1. Hi *there*").events()) == [
+				('start', ('h1', [])),
+				('text', "Hi "),
+				('start', ('strong', [])),
+				('text', "there"),
+				('end', 'strong'),
+				('end', 'h1'),
+			]
+
+	def test_nested_list(self):
+		assert list(Parser("* a\n** b").events()) == [
+				('start', ('ul', [])),
+				('start', ('li', [])),
+				('text', "a"),
+				('start', ('ul', [])),
+				('start', ('li', [])),
+				('text', "b"),
+				('end', 'li'),
+				('end', 'ul'),
+				('end', 'li'),
+				('end', 'ul'),
+			]
+
+	def test_table(self):
+		assert list(Parser("|_. a|b|").events()) == [
+				('start', ('table', [])),
+				('start', ('tr', [])),
+				('start', ('th', [])),
+				('text', "a"),
+				('end', 'th'),
+				('start', ('td', [])),
+				('text', "b"),
+				('end', 'td'),
+				('end', 'tr'),
+				('end', 'table'),
+			]
+
+	def test_flush(self):
+		assert list(Parser("flush.\n\np. x").events()) == [
+				('flush', None),
+				('start', ('p', [])),
+				('text', "x"),
+				('end', 'p'),
+			]
+
+	def test_link(self):
+		parser = Parser('"a":x first\n\n[x]http://a.example')
+		events = list(parser.events())
+
+		assert [(kind, value) for kind, value in events if kind != 'start'] == [
+				('text', "a"),
+				('end', 'a'),
+				('text', " first"),
+				('end', 'p'),
+			]
+
+		(kind, (name, attrs)) = events[1]
+		assert (kind, name) == ('start', 'a')
+		assert attrs[0][0] == 'href'
+		assert callable(attrs[0][1])
+		assert attrs[0][1](None) == "http://a.example"
+
+	def test_forward_link_stream(self):
+		text = '"a":x first\n\n[x]http://a.example'
+		assert stream(text) == '<p><a href="http://a.example">a</a> first</p>'
+		assert stream(text) == render(text)
+
+	def test_undefined_link_stream(self):
+		assert stream('"a":x first') == '<p><a href="">a</a> first</p>'
+
+
+class TestLists(object):
+	def test_nesting(self):
+		expected = '<ul><li>a<ul><li>b</li></ul></li><li>c</li></ul>'
+		assert render("* a\n** b\n* c") == expected
+		assert stream("* a\n** b\n* c") == expected
+
+	def test_continuation(self):
+		assert render("* a\ncontinued\n* b") == '<ul><li>a continued</li><li>b</li></ul>'
+
+	@pytest.mark.parametrize('text', ["*a _b_ c*", " *x* here\n* y", "*bold* text\n* item"])
+	def test_emphasis_is_not_a_list(self, text):
+		assert '<ul>' not in render(text)
+		assert render(text) == stream(text)
+		assert 'strong' in render(text)
+
+	def test_leading_continuation_starts_an_item(self):
+		parser = Parser("")
+		assert list(parser._list_levels(["text", "* a", "more"])) == [(1, "text"), (1, "a"), (None, "more")]
+
+		signature, _ = parser._signature('ul.')
+		tree = parser._tree(parser._emit_list(["text", "* a"], signature))
+		assert ''.join(unicode(node) for node in tree) == '<ul><li>text</li><li>a</li></ul>'
+
+	@pytest.mark.parametrize('chunk, levels', [
+			(["  * a", "  * b", "  * c"], [1, 1, 1]),
+			(["* a", "    * b", "  * c", "  * d"], [1, 2, 1, 1]),
+			(["* a", "  * b", "    * c", "  * d", "* e"], [1, 2, 3, 2, 1]),
+			(["* a", "** b", "\t* c", "* d"], [1, 2, 2, 1]),
+			(["* a", "*** b"], [1, 2]),
+		])
+	def test_levels(self, chunk, levels):
+		assert [level for level, _ in Parser("")._list_levels(chunk)] == levels
+
+	def test_indented_siblings(self):
+		assert render(" * a\n * b") == '<ul><li>a</li><li>b</li></ul>'
+		assert stream(" * a\n * b") == '<ul><li>a</li><li>b</li></ul>'
+
+
+class TestInput(object):
+	text = u"h1. Caf\u00e9\n\n* \u00fcber\n* na\u00efve\n\n|\u00e0|b|\n\nLast *para* \u2014 done."
+
+	def test_unicode(self):
+		assert render(self.text).startswith('<h1>Caf\u00e9</h1>')
+
+	def test_bytes(self):
+		assert Parser(self.text.encode('utf-8')).render() == render(self.text)
+
+	def test_memoryview(self):
+		assert Parser(memoryview(self.text.encode('utf-8'))).render() == render(self.text)
+
+	def test_incompatible_encoding(self):
+		assert Parser(self.text.encode('utf-16'), 'utf-16').render() == render(self.text)
+		assert Parser(memoryview(self.text.encode('utf-16')), 'utf-16').render() == render(self.text)
+
+	def test_binary_file(self):
+		from io import BytesIO
+		assert Parser(BytesIO(self.text.encode('utf-8'))).render() == render(self.text)
+
+	def test_text_file(self):
+		from io import StringIO
+		assert Parser(StringIO(self.text)).render() == render(self.text)
+
+	def test_view_blocks(self, monkeypatch):
+		from marrow.markup.textile import ViewReader
+		monkeypatch.setattr(ViewReader, 'block', 3)
+
+		data = self.text.encode('utf-8')
+		assert list(ViewReader(memoryview(data))) == data.split(b'\n')
+		assert Parser(memoryview(data)).render() == render(self.text)
+
+
+class TestPlain(object):
+	text = "h1. Title\n\nIntro with *bold*.\n\np(#note). Noted.\n\n* one\n** two\n\nbq. Quoted\n\nh2(#sub). Sub"
+
+	def test_text(self):
+		assert Parser(self.text).plain()[0] == "Title\n\nIntro with bold.\n\nNoted.\n\none\ntwo\n\nQuoted\n\nSub"
+
+	def test_outline(self):
+		text, outline = Parser(self.text).plain()
+
+		assert outline == [(0, 'h1', None), (25, 'p', 'note'), (50, 'h2', 'sub')]
+		assert [text[offset:].split("\n")[0] for offset, block, id in outline] == ["Title", "Noted.", "Sub"]
+
+	def test_empty(self):
+		assert Parser("").plain() == ("", [])
+
+
+class TestTables(object):
+	def test_cell_spec(self):
+		header, attrs = Parser("")._table_spec("_\\2/3<^(cls#ident){color:red}")
+		assert header
+		assert dict(attrs) == {
+				'colspan': '2',
+				'rowspan': '3',
+				'id': 'ident',
+				'class': 'cls',
+				'style': 'text-align: left; vertical-align: top; color:red',
+			}
+
+	def test_invalid_spec(self):
+		assert Parser("")._table_spec("nope") is None
+
+	def test_rows(self):
+		rows = [(attrs, list(cells)) for attrs, cells in Parser("")._table_rows(["|a|b|", "(x). |c\\|d|"])]
+		assert rows == [
+				([], [(False, [], 'a'), (False, [], 'b')]),
+				([('class', 'x')], [(False, [], 'c|d')]),
+			]
+
+	def test_header_cells(self):
+		expected = '<table><tr><th>a</th><td>b</td></tr><tr><td>c</td><td>d</td></tr></table>'
+		assert render("|_. a|b|\n|c|d|") == expected
+		assert stream("|_. a|b|\n|c|d|") == expected
+
+	def test_blank_row(self):
+		text = "|a|b|\n   \n|c|d|"
+		expected = '<table><tr><td>a</td><td>b</td></tr><tr><td>c</td><td>d</td></tr></table>'
+		assert render(text) == expected
+		assert stream(text) == expected
+		assert Parser(text).plain()[0] == 'a\nb\nc\nd'
+
+
+class TestCache(object):
+	def test_reuse(self):
+		from marrow.markup.cache import FragmentCache
+
+		cache = FragmentCache()
+		text = "h1. Title\n\nSome *bold* text."
+
+		assert Parser(text, cache=cache).render() == render(text)
+
+		fragments = dict(cache._fragments)
+		assert Parser(text, cache=cache).render() == render(text)
+		assert dict(cache._fragments) == fragments
+
+	def test_links_are_part_of_the_key(self):
+		from marrow.markup.cache import FragmentCache
+
+		cache = FragmentCache()
+		first = Parser('"a":x\n\n[x]http://a.example', cache=cache).render()
+		second = Parser('"a":x\n\n[x]http://b.example', cache=cache).render()
+
+		assert 'a.example' in first
+		assert 'b.example' in second
+		assert first == render('"a":x\n\n[x]http://a.example')
+		assert second == render('"a":x\n\n[x]http://b.example')
+
+	def test_unreferenced_links_are_not_part_of_the_key(self):
+		from marrow.markup.cache import FragmentCache
+
+		cache = FragmentCache()
+		shared = 'Install with "pip":pip.\n\n[pip]http://pip.example\n\n'
+
+		Parser(shared + '"a":x\n\n[x]http://a.example', cache=cache).render()
+		size = len(cache)
+
+		text = shared + '"b":y\n\n[y]http://b.example'
+		assert Parser(text, cache=cache).render() == render(text)
+		assert len(cache) == size + 2  # Only the block referencing the new link is rendered.
+
+
+class TestProcessors(object):
+	class Custom(Parser):
+		def ul(self, chunk, signature):
+			from marrow.tags import html5 as tag
+			return tag.div(class_='custom')["".join(chunk)]
+
+		def table(self, chunk, signature):
+			return "<table>"
+
+	text = "* a\n\n|a|b|\n\npara"
+	expected = '<div class="custom">* a</div>&lt;table&gt;<p>para</p>'
+
+	def test_render(self):
+		assert self.Custom(self.text).render() == self.expected
+
+	def test_stream(self):
+		assert ''.join(self.Custom(self.text).stream()) == self.expected
+
+	def test_events(self):
+		kinds = [kind for kind, value in self.Custom(self.text).events()]
+		assert kinds[:2] == ['node', 'node']
+
+	def test_builtin(self):
+		assert render(self.text) == '<ul><li>a</li></ul><table><tr><td>a</td><td>b</td></tr></table><p>para</p>'
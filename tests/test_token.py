@@ -0,0 +1,51 @@
+# encoding: utf-8
+
+from marrow.markup.token import InlineToken, EnclosingToken
+
+
+strong = EnclosingToken('strong', '*')
+link = EnclosingToken('link', '[', ']')
+dash = InlineToken('dash', '--')
+
+
+def matches(token, text, *args):
+	return [tuple(text[span] for span in spans) for spans in token.finditer(text, *args)]
+
+
+class TestInlineToken(object):
+	def test_finditer(self):
+		assert list(dash.finditer("a -- b --")) == [(slice(2, 4), ), (slice(7, 9), )]
+
+	def test_finditer_does_not_overlap(self):
+		assert matches(dash, "---") == [("--", )]
+		assert matches(dash, "----") == [("--", ), ("--", )]
+
+	def test_finditer_range(self):
+		assert list(dash.finditer("-- a --", 1)) == [(slice(5, 7), )]
+		assert list(dash.finditer("-- a --", 0, 4)) == [(slice(0, 2), )]
+
+
+class TestEnclosingToken(object):
+	def test_finditer(self):
+		assert matches(strong, "a *b* c *d*") == [("*", "b", "*"), ("*", "d", "*")]
+
+	def test_finditer_asymmetric(self):
+		assert matches(link, "[a] and [b]") == [("[", "a", "]"), ("[", "b", "]")]
+
+	def test_finditer_unmatched(self):
+		assert matches(strong, "a *b") == []
+
+	def test_finditer_rejects_empty(self):
+		assert matches(link, "[] [a]") == [("[", "a", "]")]
+		assert matches(strong, "**a*") == [("*", "a", "*")]
+		assert matches(strong, "** x") == []
+
+	def test_finditer_range(self):
+		assert matches(strong, "*a* *b*", 1) == [("*", " ", "*")]
+		assert matches(strong, "*a* *b*", 0, 3) == [("*", "a", "*")]
+
+	def test_partition(self):
+		assert strong.partition("a *b* c *d*") == ("a ", "b", " c *d*")
+
+	def test_partition_unmatched(self):
+		assert strong.partition("a b") == ("a b", "", "")